@@ -1,7 +1,6 @@
 import streamlit as st
 import pandas as pd
 import folium
-from streamlit_folium import st_folium
 import json
 
 # Set page config
@@ -12,12 +11,32 @@ st.set_page_config(
 )
 
 # Load the data
-@st.cache_data
+@st.cache_resource
 def load_data():
-    df = pd.read_csv('data/processed/master_dataset.csv')
+    # cache_resource shares one DataFrame across sessions without hashing or
+    # copying it on every rerun — treat the result as read-only
+    df = pd.read_parquet('data/processed/master_dataset.parquet')
+    return df
+
+@st.cache_data
+def load_park_geojson():
     with open('data/west_coast_park.json', 'r') as f:
-        park_geojson = json.load(f)
-    return df, park_geojson
+        return json.load(f)
+
+@st.cache_resource
+def render_park_map_html():
+    # Render the map once and serve the HTML; the dashboard needs no map-state
+    # callbacks, so skipping st_folium avoids the Python round trip on every
+    # pan/zoom
+    m = folium.Map(
+        location=[1.2937, 103.7686],
+        zoom_start=15
+    )
+    folium.GeoJson(
+        load_park_geojson(),
+        name='West Coast Park'
+    ).add_to(m)
+    return m.get_root().render()
 
 # Initialize the app
 def main():
@@ -25,27 +44,15 @@ def main():
     st.write('Interactive analytics dashboard for West Coast Park')
 
     # Load data
-    df, park_geojson = load_data()
+    df = load_data()
 
     # Create two columns for layout
     col1, col2 = st.columns([2, 1])
 
     with col1:
         st.subheader('Park Map')
-        # Initialize folium map centered on West Coast Park
-        m = folium.Map(
-            location=[1.2937, 103.7686],
-            zoom_start=15
-        )
-
-        # Add park boundary
-        folium.GeoJson(
-            park_geojson,
-            name='West Coast Park'
-        ).add_to(m)
-
-        # Display the map
-        st_folium(m, width=700)
+        # Display the pre-rendered map
+        st.components.v1.html(render_park_map_html(), height=600, scrolling=False)
 
     with col2:
         st.subheader('Park Statistics')
@@ -4,81 +4,121 @@ Create a Folium map from the consolidated master dataset.
 Saves HTML to data/processed/master_map.html
 
 Usage:
-    python scripts/make_master_map.py --input data/processed/master_dataset.csv --out data/processed/master_map.html
+    python scripts/make_master_map.py --input data/processed/master_dataset.parquet --out data/processed/master_map.html
 """
 import argparse
 import os
+import re
 import pandas as pd
 import folium
 from folium import plugins
 
+NUMBER_RE = re.compile(r'([-+]?\d*\.\d+|[-+]?\d+)')
+
 def choose_best_column(df, candidates):
-    """Return the column with the most numeric values among candidates."""
-    best_col = None
-    max_count = -1
-    for c in candidates:
-        if c in df.columns:
-            numeric_count = pd.to_numeric(df[c], errors='coerce').notna().sum()
-            if numeric_count > max_count:
-                max_count = numeric_count
-                best_col = c
-    return best_col
+    """Return (column, coerced_series) for the candidate with the most numeric values.
+
+    The coerced series is returned so callers don't have to re-run pd.to_numeric
+    on the winning column.
+    """
+    present = [c for c in candidates if c in df.columns]
+    if not present:
+        return None, None
+    coerced = df[present].apply(pd.to_numeric, errors='coerce')
+    counts = coerced.notna().sum()
+    if counts.max() == 0:
+        return None, None
+    best = counts.idxmax()
+    return best, coerced[best]
 
 def extract_numeric_series(s: pd.Series) -> pd.Series:
     """Convert series to numeric, fallback to extracting numbers from strings."""
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype('float64')
     out = pd.to_numeric(s, errors='coerce')
     if out.notna().sum() > 0:
         return out
-    extracted = s.astype(str).str.extract(r'([-+]?\d*\.\d+|[-+]?\d+)')
+    extracted = s.astype(str).str.extract(NUMBER_RE)
     if extracted.shape[1] >= 1:
         return pd.to_numeric(extracted[0], errors='coerce')
     return out
 
+LAT_CANDIDATES = ['_lat', 'lat', 'latitude', 'y']
+LON_CANDIDATES = ['_lon', 'lon', 'longitude', 'x']
+GEOM_CANDIDATES = ['geometry', 'geom', 'coordinates']
+POPUP_CANDIDATES = ['_source_file', 'NAME', 'name', 'id', 'road_name', 'address', 'Description']
+
 def main(input_fp: str, out_fp: str, min_count: int = 1):
     if not os.path.exists(input_fp):
         raise SystemExit(f"Input file not found: {input_fp}")
 
-    df = pd.read_csv(input_fp, low_memory=False)
+    # Only load the columns the map actually uses; sniff the schema/header first
+    wanted = set(LAT_CANDIDATES + LON_CANDIDATES + GEOM_CANDIDATES + POPUP_CANDIDATES)
+    if input_fp.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        header = pq.read_schema(input_fp).names
+        df = pd.read_parquet(input_fp, columns=[c for c in header if c in wanted])
+    else:
+        header = pd.read_csv(input_fp, nrows=0).columns
+        usecols = [c for c in header if c in wanted]
+        try:
+            df = pd.read_csv(input_fp, usecols=usecols, engine='pyarrow')
+        except (ImportError, ValueError):
+            df = pd.read_csv(input_fp, usecols=usecols, low_memory=False)
 
     # Pick the latitude/longitude columns with the most numeric values
-    lat_col = choose_best_column(df, ['_lat', 'lat', 'latitude', 'y'])
-    lon_col = choose_best_column(df, ['_lon', 'lon', 'longitude', 'x'])
+    lat_col, lat_series = choose_best_column(df, LAT_CANDIDATES)
+    lon_col, lon_series = choose_best_column(df, LON_CANDIDATES)
     print(f"Using latitude: {lat_col}, longitude: {lon_col}")
 
     # If not found, try geometry columns
     geom_candidate = None
     if (lat_col is None or lon_col is None):
-        for key in ['geometry', 'geom', 'coordinates']:
+        for key in GEOM_CANDIDATES:
             if key in df.columns:
                 geom_candidate = key
                 break
         if geom_candidate:
-            import json as _json
-            lats, lons = [], []
-            for val in df[geom_candidate].fillna(''):
-                try:
-                    obj = _json.loads(val)
-                    if isinstance(obj, dict) and 'coordinates' in obj:
-                        coords = obj['coordinates']
-                        lons.append(coords[0])
-                        lats.append(coords[1])
-                        continue
-                    if isinstance(obj, list) and len(obj) >= 2:
-                        lons.append(obj[0])
-                        lats.append(obj[1])
-                        continue
-                except Exception:
-                    continue
-            if lats and lons:
-                df['_lat_extracted'] = pd.to_numeric(lats, errors='coerce')
-                df['_lon_extracted'] = pd.to_numeric(lons, errors='coerce')
+            import numpy as np
+            import shapely
+            vals = df[geom_candidate].fillna('').astype(str)
+            lats = pd.Series(np.nan, index=df.index)
+            lons = pd.Series(np.nan, index=df.index)
+            # GeoJSON objects: parse the whole column in one libgeos call
+            geo_mask = vals.str.startswith('{')
+            if geo_mask.any():
+                geoms = shapely.from_geojson(vals[geo_mask].to_numpy(), on_invalid='ignore')
+                cents = shapely.centroid(geoms)
+                lons[geo_mask] = shapely.get_x(cents)
+                lats[geo_mask] = shapely.get_y(cents)
+            # Bare [lon, lat] lists: split the strings vectorized
+            list_mask = vals.str.startswith('[')
+            if list_mask.any():
+                pairs = vals[list_mask].str.strip('[]').str.split(',', n=2, expand=True)
+                if pairs.shape[1] >= 2:
+                    lons[list_mask] = pd.to_numeric(pairs[0], errors='coerce')
+                    lats[list_mask] = pd.to_numeric(pairs[1], errors='coerce')
+            if lats.notna().any() and lons.notna().any():
+                df['_lat_extracted'] = lats
+                df['_lon_extracted'] = lons
                 lat_col = '_lat_extracted'
                 lon_col = '_lon_extracted'
+                # Use the extracted pair for both axes; a cached series from a
+                # partial candidate match would mix coordinate sources
+                lat_series = lon_series = None
 
-    # Convert to numeric
+    # Convert to numeric, reusing the coercion done during column selection and
+    # skipping columns that are already numeric (e.g. the geometry-fallback
+    # extraction always yields floats)
     if lat_col and lon_col:
-        df[lat_col] = extract_numeric_series(df[lat_col])
-        df[lon_col] = extract_numeric_series(df[lon_col])
+        if lat_series is not None:
+            df[lat_col] = lat_series
+        elif not pd.api.types.is_numeric_dtype(df[lat_col]):
+            df[lat_col] = extract_numeric_series(df[lat_col])
+        if lon_series is not None:
+            df[lon_col] = lon_series
+        elif not pd.api.types.is_numeric_dtype(df[lon_col]):
+            df[lon_col] = extract_numeric_series(df[lon_col])
     else:
         raise SystemExit('No latitude/longitude columns found.')
 
@@ -93,23 +133,42 @@ def main(input_fp: str, out_fp: str, min_count: int = 1):
     center_lat = float(df[lat_col].mean())
     center_lon = float(df[lon_col].mean())
 
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=12)
+    # prefer_canvas renders markers on a single canvas instead of one DOM node each
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=12, prefer_canvas=True)
 
-    # Heatmap layer
-    heat_points = df[[lat_col, lon_col]].values.tolist()
+    # Heatmap layer: pre-bin to a ~10m grid with counts as weights instead of
+    # shipping every raw point to Leaflet.heat, which would bin them anyway
+    grid = df.groupby([df[lat_col].round(4), df[lon_col].round(4)]).size().reset_index(name='w')
+    heat_points = grid[[lat_col, lon_col, 'w']].to_numpy().tolist()
     if heat_points:
         plugins.HeatMap(heat_points, radius=8, blur=10, min_opacity=0.2).add_to(m)
 
-    # Clustered markers
-    marker_cluster = plugins.MarkerCluster(name='Points').add_to(m)
-    popup_cols = [c for c in ['_source_file', 'NAME', 'name', 'id', 'road_name', 'address', 'Description'] if c in df.columns]
-
-    for _, row in df.iterrows():
-        lat = float(row[lat_col])
-        lon = float(row[lon_col])
-        details = [f"<b>{col}</b>: {row[col]}" for col in popup_cols if pd.notna(row[col])]
-        popup = folium.Popup('<br/>'.join(details), max_width=300) if details else None
-        folium.CircleMarker(location=[lat, lon], radius=4, color='blue', fill=True, popup=popup).add_to(marker_cluster)
+    # Clustered markers: hand the raw coordinates to Leaflet and let it build the
+    # markers client-side instead of creating one Python CircleMarker per row.
+    popup_cols = [c for c in POPUP_CANDIDATES if c in df.columns]
+
+    # Build the popup HTML with one vectorized string op per column instead of
+    # formatting row by row
+    popup_series = pd.Series('', index=df.index)
+    for col in popup_cols:
+        mask = df[col].notna()
+        popup_series.loc[mask] += '<b>' + col + '</b>: ' + df.loc[mask, col].astype(str) + '<br/>'
+    popup_series = popup_series.str.replace(r'<br/>$', '', regex=True)
+
+    data = df[[lat_col, lon_col]].to_numpy().tolist()
+    for point, popup in zip(data, popup_series.tolist()):
+        point.append(popup)
+
+    callback = """
+    function (row) {
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {radius: 4, color: 'blue', fill: true});
+        if (row[2]) {
+            marker.bindPopup(row[2], {maxWidth: 300});
+        }
+        return marker;
+    };
+    """
+    plugins.FastMarkerCluster(data, callback=callback, name='Points').add_to(m)
 
     folium.LayerControl().add_to(m)
     os.makedirs(os.path.dirname(out_fp), exist_ok=True)
@@ -118,7 +177,7 @@ def main(input_fp: str, out_fp: str, min_count: int = 1):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input', '-i', default=os.path.join('data', 'processed', 'master_dataset.csv'))
+    parser.add_argument('--input', '-i', default=os.path.join('data', 'processed', 'master_dataset.parquet'))
     parser.add_argument('--out', '-o', default=os.path.join('data', 'processed', 'master_map.html'))
     args = parser.parse_args()
     main(args.input, args.out)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Process datasets in ./data (raw and processed) and consolidate into a master tabular dataset.
-Saves outputs to data/processed/master_dataset.parquet and master_dataset.csv
+Saves output to data/processed/master_dataset.parquet (CSV with --csv)
 
 Usage:
     python scripts/process_all.py --data-dir data --out-dir data/processed
@@ -11,78 +11,159 @@ CSV files and simple XML files (via xmltodict). Geometry centroids are computed
 when geometry is present.
 """
 import os
+import csv
 import json
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from pathlib import Path
 from typing import List
 
+import numpy as np
 import pandas as pd
-from pandas import json_normalize
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 try:
-    from shapely.geometry import shape, Point
+    import shapely
 except Exception:
-    shape = None
+    shapely = None
 
 try:
     import xmltodict
 except Exception:
     xmltodict = None
 
+try:
+    import orjson as fastjson
+except Exception:
+    try:
+        import ujson as fastjson
+    except Exception:
+        fastjson = None
+
+
+def _load_json(fp):
+    """Parse a JSON file, preferring orjson/ujson over the stdlib parser."""
+    with open(fp, 'rb') as f:
+        raw = f.read()
+    if fastjson is not None:
+        return fastjson.loads(raw)
+    return json.loads(raw)
+
+
+def _flatten(d, sep='_', prefix=''):
+    """Flatten a nested dict into (key, value) pairs, joining keys with sep."""
+    for k, v in d.items():
+        key = f"{prefix}{sep}{k}" if prefix else str(k)
+        if isinstance(v, dict):
+            yield from _flatten(v, sep=sep, prefix=key)
+        else:
+            yield key, v
+
+
+def _normalize_large_types(table):
+    """Downcast large_string/large_binary columns to their plain variants.
+
+    Tables built from row dicts use string/binary while Table.from_pandas can
+    produce the large_ types (pandas 3.x), and pa.concat_tables refuses to
+    unify the two.
+    """
+    fields = []
+    changed = False
+    for f in table.schema:
+        if pa.types.is_large_string(f.type):
+            fields.append(f.with_type(pa.string()))
+            changed = True
+        elif pa.types.is_large_binary(f.type):
+            fields.append(f.with_type(pa.binary()))
+            changed = True
+        else:
+            fields.append(f)
+    return table.cast(pa.schema(fields)) if changed else table
+
+
+def _table_from_rows(rows):
+    """Build an Arrow table from row dicts, unioning keys across all rows.
+
+    pa.Table.from_pylist infers the schema from the first row only and
+    silently drops every key that row lacks, so assemble the columns
+    explicitly with keys in first-seen order.
+    """
+    keys = {}
+    for row in rows:
+        for k in row:
+            keys.setdefault(k, None)
+    return pa.table({k: [row.get(k) for row in rows] for k in keys})
+
 
 def find_files(data_dir: str, exts: List[str] = None) -> List[str]:
     if exts is None:
         exts = ['.json', '.geojson', '.csv', '.xml']
-    out = []
-    for root, dirs, files in os.walk(data_dir):
-        for f in files:
-            if any(f.lower().endswith(ext) for ext in exts):
-                out.append(os.path.join(root, f))
-    return out
+    exts_set = frozenset(e.lstrip('.').lower() for e in exts)
+
+    def walk(d):
+        try:
+            entries = os.scandir(d)
+        except OSError:
+            # Unreadable or vanished directory: skip it, like os.walk did
+            return
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield from walk(entry.path)
+                    elif entry.is_file() and '.' in entry.name \
+                            and entry.name.rpartition('.')[2].lower() in exts_set:
+                        yield entry.path
+                except OSError:
+                    continue
+
+    return list(walk(data_dir))
 
 
 def try_parse_geojson(fp: str):
-    with open(fp, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = _load_json(fp)
     features = []
     if isinstance(data, dict) and 'features' in data:
+        geom_json_strs = []
         for feat in data['features']:
             prop = feat.get('properties', {}) or {}
             geom = feat.get('geometry')
-            geom_type = None
-            lon = lat = None
-            if geom is not None and shape is not None:
-                try:
-                    geom_obj = shape(geom)
-                    geom_type = geom.get('type')
-                    centroid = geom_obj.centroid
-                    lon = centroid.x
-                    lat = centroid.y
-                except Exception:
-                    geom_obj = None
+            geom_json_strs.append(json.dumps(geom) if geom is not None else 'null')
             # Flatten properties
-            row = json_normalize(prop, sep='_').to_dict(orient='records')
-            row = row[0] if row else {}
+            row = dict(_flatten(prop))
             row.update({
                 '_source_file': fp,
-                '_geom_type': geom_type,
-                '_lon': lon,
-                '_lat': lat,
+                '_geom_type': geom.get('type') if isinstance(geom, dict) else None,
+                '_lon': None,
+                '_lat': None,
             })
             features.append(row)
+        # Compute all centroids in one pass through libgeos instead of one
+        # Python<->GEOS round trip per feature
+        if features and shapely is not None:
+            geoms = shapely.from_geojson(np.asarray(geom_json_strs, dtype=object), on_invalid='ignore')
+            cents = shapely.centroid(geoms)
+            lons = shapely.get_x(cents)
+            lats = shapely.get_y(cents)
+            for row, lon, lat in zip(features, lons, lats):
+                if not (np.isnan(lon) or np.isnan(lat)):
+                    row['_lon'] = float(lon)
+                    row['_lat'] = float(lat)
     return features
 
 
 def try_parse_json_array(fp: str):
-    with open(fp, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = _load_json(fp)
     rows = []
     if isinstance(data, list):
         for obj in data:
             if isinstance(obj, dict):
-                row = json_normalize(obj, sep='_').to_dict(orient='records')
-                row = row[0] if row else {}
+                row = dict(_flatten(obj))
                 row.update({'_source_file': fp})
                 rows.append(row)
     elif isinstance(data, dict):
@@ -91,8 +172,7 @@ def try_parse_json_array(fp: str):
         for k, v in data.items():
             if isinstance(v, list) and v and isinstance(v[0], dict):
                 for obj in v:
-                    row = json_normalize(obj, sep='_').to_dict(orient='records')
-                    row = row[0] if row else {}
+                    row = dict(_flatten(obj))
                     row.update({'_source_file': fp, '_root_key': k})
                     rows.append(row)
                 break
@@ -119,7 +199,9 @@ def try_parse_csv(fp: str):
         if col in df.columns:
             df.rename(columns={col: '_lon'}, inplace=True)
             break
-    return df.to_dict(orient='records')
+    # Keep the DataFrame as-is; exploding it into per-row dicts only for main()
+    # to rebuild a frame from them wastes time and memory
+    return df
 
 
 def try_parse_xml(fp: str):
@@ -131,28 +213,28 @@ def try_parse_xml(fp: str):
         d = xmltodict.parse(txt)
     except Exception:
         return []
-    # Find first list of dicts
+    # Find first list of dicts, breadth-first with an explicit stack so deep
+    # XML trees can't hit the recursion limit
     rows = []
-    def walk(obj):
+    candidate = None
+    queue = deque([d])
+    while queue:
+        obj = queue.popleft()
         if isinstance(obj, list) and obj and isinstance(obj[0], dict):
-            return obj
+            candidate = obj
+            break
         if isinstance(obj, dict):
-            for v in obj.values():
-                r = walk(v)
-                if r:
-                    return r
-        return None
-    candidate = walk(d)
+            queue.extend(obj.values())
     if candidate:
         for item in candidate:
-            row = json_normalize(item, sep='_').to_dict(orient='records')
-            row = row[0] if row else {}
+            row = dict(_flatten(item))
             row.update({'_source_file': fp})
             rows.append(row)
     return rows
 
 
 def process_file(fp: str):
+    """Parse one file into a list of row dicts, or a DataFrame for CSV inputs."""
     ext = fp.lower().split('.')[-1]
     rows = []
     try:
@@ -169,23 +251,29 @@ def process_file(fp: str):
     return rows
 
 
-def main(data_dir: str, out_dir: str, limit_files: int = None):
-    Path(out_dir).mkdir(parents=True, exist_ok=True)
-    files = find_files(data_dir)
-    print(f"Found {len(files)} files to inspect under {data_dir}")
-    if limit_files:
-        files = files[:limit_files]
-    all_rows = []
-    for i, fp in enumerate(files, 1):
-        print(f"[{i}/{len(files)}] Processing: {fp}")
-        rows = process_file(fp)
-        if rows:
-            all_rows.extend(rows)
-    if not all_rows:
-        print("No tabular rows extracted. Exiting.")
-        return 1
-    print(f"Collected {len(all_rows)} rows. Building DataFrame...")
-    df = pd.DataFrame(all_rows)
+def iter_file_rows(files: List[str], workers: int = None):
+    """Yield each file's parsed rows, fanning out across cores when worthwhile."""
+    # Each file parses independently, so fan out across cores; the pool is not
+    # worth its startup cost for a handful of files
+    if len(files) >= 4 and (workers is None or workers > 1):
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            # Collect in submission order: the consumer is serial anyway, and
+            # completion order would make row/column order vary run to run
+            futures = [(fp, ex.submit(process_file, fp)) for fp in files]
+            for i, (fp, fut) in enumerate(futures, 1):
+                print(f"[{i}/{len(files)}] Processing: {fp}")
+                yield fut.result()
+    else:
+        for i, fp in enumerate(files, 1):
+            print(f"[{i}/{len(files)}] Processing: {fp}")
+            yield process_file(fp)
+
+
+def _write_outputs_pandas(all_rows, frames, out_csv, out_parquet, write_csv):
+    """Fallback for inputs Arrow cannot reconcile: pandas object columns accept
+    any mix of types."""
+    parts = ([pd.DataFrame(all_rows)] if all_rows else []) + frames
+    df = pd.concat(parts, ignore_index=True, sort=False)
     # Normalize column names
     df.columns = [c if isinstance(c, str) else str(c) for c in df.columns]
     # Reorder so source file and geometry columns come first if present
@@ -193,16 +281,197 @@ def main(data_dir: str, out_dir: str, limit_files: int = None):
     front = [c for c in ['_source_file', '_root_key', '_geom_type', '_lon', '_lat'] if c in cols]
     rest = [c for c in cols if c not in front]
     df = df[front + rest]
-    # Save
+    if write_csv:
+        df.to_csv(out_csv, index=False)
+        print(f"Saved master CSV → {out_csv}")
+    try:
+        df.to_parquet(out_parquet, index=False, compression='zstd')
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Stringify the non-null values of mixed-type columns and retry
+        for c in df.columns[df.dtypes == object]:
+            df[c] = df[c].where(df[c].isna(), df[c].astype(str))
+        df.to_parquet(out_parquet, index=False, compression='zstd')
+        print("Warning: mixed-type columns were written to Parquet as strings")
+    print(f"Saved master Parquet → {out_parquet}")
+
+
+def _merge_fields(schemas):
+    """Union fields across schemas, demoting conflicts that unify_schemas
+    cannot promote (e.g. int64 vs string) to pa.string()."""
+    merged = {}
+    for schema in schemas:
+        for field in schema:
+            prev = merged.get(field.name)
+            if prev is None:
+                merged[field.name] = field
+            elif not prev.type.equals(field.type):
+                try:
+                    pair = pa.unify_schemas([pa.schema([prev]), pa.schema([field])],
+                                            promote_options='permissive')
+                    merged[field.name] = pair.field(0)
+                except (pa.ArrowTypeError, TypeError):
+                    merged[field.name] = pa.field(field.name, pa.string())
+    return pa.schema(list(merged.values()))
+
+
+def _align_table(table, schema):
+    """Project a table onto schema: add missing columns as nulls, cast the rest."""
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            col = table.column(field.name)
+            if not col.type.equals(field.type):
+                col = col.cast(field.type, safe=False)
+            columns.append(col)
+        else:
+            columns.append(pa.nulls(len(table), field.type))
+    return pa.table(columns, schema=schema)
+
+
+def _unified_schema(files: List[str], workers: int = None):
+    """Parse every file once and unify the per-file schemas into one.
+
+    The field order is deterministic regardless of worker completion order:
+    the usual front columns first, the rest sorted by name.
+    """
+    schemas = []
+    for rows in iter_file_rows(files, workers):
+        if rows is None or len(rows) == 0:
+            continue
+        if isinstance(rows, pd.DataFrame):
+            table = _normalize_large_types(pa.Table.from_pandas(rows, preserve_index=False))
+        else:
+            table = _table_from_rows(rows)
+        schemas.append(table.schema)
+    if not schemas:
+        return None
+    try:
+        schema = pa.unify_schemas(schemas, promote_options='permissive')
+    except pa.ArrowTypeError:
+        # Irreconcilable field types (e.g. int64 vs string): demote those
+        # fields to string rather than abort the run
+        schema = _merge_fields(schemas)
+    except TypeError as e:
+        if 'promote_options' not in str(e):
+            raise
+        try:
+            schema = pa.unify_schemas(schemas)  # pyarrow < 14
+        except pa.ArrowTypeError:
+            schema = _merge_fields(schemas)
+    front = [c for c in ['_source_file', '_root_key', '_geom_type', '_lon', '_lat'] if c in schema.names]
+    rest = sorted(c for c in schema.names if c not in front)
+    return pa.schema([schema.field(c) for c in front + rest])
+
+
+def stream_to_disk(files: List[str], out_csv: str, out_parquet: str, workers: int = None,
+                   write_csv: bool = False) -> int:
+    """Write each file's rows straight to the outputs instead of holding all rows in memory.
+
+    A first pass over the files builds a unified schema (the union of every
+    file's columns), then a second pass writes chunk by chunk, so memory stays
+    bounded by the largest single file at the cost of parsing twice.
+    Returns the number of rows written.
+    """
+    print("Pass 1/2: building unified schema...")
+    schema = _unified_schema(files, workers)
+    if schema is None:
+        return 0
+    print(f"Pass 2/2: writing {len(schema.names)} columns...")
+    total = 0
+    writer = pq.ParquetWriter(out_parquet, schema, compression='zstd')
+    csv_f = csv_writer = None
+    try:
+        if write_csv:
+            csv_f = open(out_csv, 'w', newline='', encoding='utf-8')
+            csv_writer = csv.DictWriter(csv_f, fieldnames=schema.names, extrasaction='ignore', restval='')
+            csv_writer.writeheader()
+        for rows in iter_file_rows(files, workers):
+            if rows is None or len(rows) == 0:
+                continue
+            if isinstance(rows, pd.DataFrame):
+                # The rolling CSV writer needs dicts; this is per-file, so
+                # memory stays bounded by the largest input
+                rows = rows.to_dict(orient='records')
+            # Build with natural types, then cast onto the unified schema so
+            # demoted fields (e.g. int -> string) convert instead of erroring
+            writer.write_table(_align_table(_table_from_rows(rows), schema))
+            if csv_writer is not None:
+                csv_writer.writerows(rows)
+            total += len(rows)
+    finally:
+        writer.close()
+        if csv_f is not None:
+            csv_f.close()
+    return total
+
+
+def main(data_dir: str, out_dir: str, limit_files: int = None, workers: int = None, stream: bool = False,
+         write_csv: bool = False):
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    files = find_files(data_dir)
+    print(f"Found {len(files)} files to inspect under {data_dir}")
+    if limit_files:
+        files = files[:limit_files]
     out_csv = os.path.join(out_dir, 'master_dataset.csv')
     out_parquet = os.path.join(out_dir, 'master_dataset.parquet')
-    df.to_csv(out_csv, index=False)
+    if stream:
+        total = stream_to_disk(files, out_csv, out_parquet, workers, write_csv)
+        if not total:
+            print("No tabular rows extracted. Exiting.")
+            return 1
+        if write_csv:
+            print(f"Saved master CSV → {out_csv}")
+        print(f"Saved master Parquet → {out_parquet}")
+        print(f"Streamed {total} rows to disk.")
+        return 0
+    all_rows = []
+    frames = []
+    for rows in iter_file_rows(files, workers):
+        if rows is None or len(rows) == 0:
+            continue
+        if isinstance(rows, pd.DataFrame):
+            frames.append(rows)
+        else:
+            all_rows.extend(rows)
+    if not all_rows and not frames:
+        print("No tabular rows extracted. Exiting.")
+        return 1
+    total = len(all_rows) + sum(len(f) for f in frames)
+    # Build the table with Arrow's column builders instead of going through
+    # pandas' row-wise block manager
+    print(f"Collected {total} rows. Building Arrow table...")
     try:
-        df.to_parquet(out_parquet, index=False)
-    except Exception as e:
-        print(f"Warning: could not save parquet ({e}). You may need pyarrow or fastparquet installed.")
-    print(f"Saved master CSV → {out_csv}")
-    print(f"Saved master Parquet → {out_parquet} (if supported)")
+        tables = []
+        if all_rows:
+            tables.append(_table_from_rows(all_rows))
+        tables.extend(_normalize_large_types(pa.Table.from_pandas(f, preserve_index=False)) for f in frames)
+        if len(tables) == 1:
+            table = tables[0]
+        else:
+            try:
+                # permissive promotion resolves e.g. int64 vs double, matching
+                # what stream mode accepts
+                table = pa.concat_tables(tables, promote_options='permissive')
+            except TypeError as e:
+                # ArrowTypeError subclasses TypeError; only retry the legacy
+                # keyword when the new one is genuinely unsupported (pyarrow < 14)
+                if 'promote_options' not in str(e):
+                    raise
+                table = pa.concat_tables(tables, promote=True)
+        cols = table.column_names
+        front = [c for c in ['_source_file', '_root_key', '_geom_type', '_lon', '_lat'] if c in cols]
+        rest = [c for c in cols if c not in front]
+        table = table.select(front + rest)
+        pq.write_table(table, out_parquet, compression='zstd')
+        if write_csv:
+            pacsv.write_csv(table, out_csv)
+            print(f"Saved master CSV → {out_csv}")
+        print(f"Saved master Parquet → {out_parquet}")
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        # Columns with irreconcilable types across files (e.g. int ids in one,
+        # string ids in another) must degrade, not abort the ingest
+        print(f"Warning: Arrow could not unify the collected rows ({e}); building with pandas instead")
+        _write_outputs_pandas(all_rows, frames, out_csv, out_parquet, write_csv)
     return 0
 
 
@@ -211,6 +480,12 @@ if __name__ == '__main__':
     p.add_argument('--data-dir', default='data', help='Root data directory to scan')
     p.add_argument('--out-dir', default=os.path.join('data', 'processed'), help='Output directory for master dataset')
     p.add_argument('--limit', type=int, default=0, help='Optional: limit to first N files for testing')
+    p.add_argument('--workers', type=int, default=0, help='Parallel worker processes (0 = one per core, 1 = serial)')
+    p.add_argument('--stream', action='store_true',
+                   help='Write rows to disk per file instead of in one batch (for datasets larger than RAM)')
+    p.add_argument('--csv', action='store_true',
+                   help='Also write master_dataset.csv (Parquet is the primary output)')
     args = p.parse_args()
     limit = args.limit if args.limit > 0 else None
-    exit(main(args.data_dir, args.out_dir, limit))
+    workers = args.workers if args.workers > 0 else None
+    exit(main(args.data_dir, args.out_dir, limit, workers, args.stream, args.csv))
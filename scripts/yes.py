@@ -1,30 +1,39 @@
 import pandas as pd
+import pyarrow.parquet as pq
 from shapely import wkt
 
-df = pd.read_csv("data/processed/master_dataset.csv")
 # Pick the columns with the most numeric data instead of the first match
 lat_cols = ['_lat', 'lat', 'latitude', 'y']
 lon_cols = ['_lon', 'lon', 'longitude', 'x']
 
+# Only the coordinate candidates are needed; Parquet reads skip the rest
+fp = "data/processed/master_dataset.parquet"
+header = pq.read_schema(fp).names
+usecols = [c for c in header if c in set(lat_cols + lon_cols)]
+df = pd.read_parquet(fp, columns=usecols)
+
 def choose_best_column(df, candidates):
-    best_col = None
-    max_count = -1
-    for c in candidates:
-        if c in df.columns:
-            numeric_count = pd.to_numeric(df[c], errors='coerce').notna().sum()
-            if numeric_count > max_count:
-                max_count = numeric_count
-                best_col = c
-    return best_col
-
-lat_col = choose_best_column(df, lat_cols)
-lon_col = choose_best_column(df, lon_cols)
+    present = [c for c in candidates if c in df.columns]
+    if not present:
+        return None, None
+    coerced = df[present].apply(pd.to_numeric, errors='coerce')
+    counts = coerced.notna().sum()
+    if counts.max() == 0:
+        return None, None
+    best = counts.idxmax()
+    return best, coerced[best]
+
+lat_col, lat_series = choose_best_column(df, lat_cols)
+lon_col, lon_series = choose_best_column(df, lon_cols)
 
 print(f"Using latitude: {lat_col}, longitude: {lon_col}")
 
-# Convert to numeric
-df[lat_col] = pd.to_numeric(df[lat_col], errors='coerce')
-df[lon_col] = pd.to_numeric(df[lon_col], errors='coerce')
+if lat_col is None or lon_col is None:
+    raise SystemExit('No latitude/longitude columns found.')
+
+# Reuse the coercion done during column selection
+df[lat_col] = lat_series
+df[lon_col] = lon_series
 
 # Drop rows without coordinates
 df = df.dropna(subset=[lat_col, lon_col])